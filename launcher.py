@@ -10,7 +10,7 @@ if __name__ == '__main__':
     log = log.getChild(__name__)
     try:
         config = config_app.load()
-    except (FileNotFoundError, YAMLValidationError) as error:
+    except (FileNotFoundError, YAMLValidationError, config_app.ConfigVersionError) as error:
         if isinstance(error, FileNotFoundError):
             config_file = config_app.CONFIG_FILE
             config_app.create(path=config_file)
@@ -19,24 +19,30 @@ if __name__ == '__main__':
             print(error)
         exit(1)
     else:
-        channel = config['main']['channel'].lower()
-        quality = config['main']['quality'] or 'chunked'
+        main_config, storage_config, telegram_config = config['main'], config['storage'], config['telegram']
+        channel = main_config['channel'].lower()
+        quality = main_config['quality'] or 'chunked'
         twitch_api = TwitchAPI(config['twitch']['client_id'],
-                               request_wrapper=retry_on_exception(RequestException, wait=6, max_tries=10))
-        storage = Storage(config['storage']['path'],
+                               request_wrapper=retry_on_exception(RequestException, wait=1, max_tries=10,
+                                                                  backoff=2, max_wait=10, jitter=1))
+        storage = Storage(storage_config['path'],
                           channel_from_id=lambda id_: str(twitch_api.get_users(id=[id_])[0]['login']),
-                          vod_path_template=config['storage']['vod_path'])
+                          vod_path_template=storage_config['vod_path'])
         message_center = Provider()
-        download_manager = TwitchDownloadManager(twitch_api, config['main']['temp_dir'])
+        download_manager = TwitchDownloadManager(twitch_api, main_config['temp_dir'])
         main_publisher = Publisher()
         console = ConsoleView()
         message_center.connect(main_publisher, download_manager, console)
         console.subscribe(MainPublisherEvent)
         console.subscribe(DownloaderEvent)
-        if config['telegram']['enabled']:
-            telegram = TelegramView(token=config['telegram']['api_token'], chat_id=config['telegram']['chat_id'])
+        if telegram_config['enabled']:
+            telegram = TelegramView(token=telegram_config['api_token'], chat_id=telegram_config['chat_id'])
             telegram.connect_to(message_center)
             telegram.subscribe(DownloaderEvent)
             telegram.subscribe(ExceptionEvent)
 
-        main(channel, quality, main_publisher, twitch_api, download_manager, storage)
+        try:
+            main(channel, quality, main_publisher, twitch_api, download_manager, storage)
+        finally:
+            storage.close()
+            twitch_api.close()
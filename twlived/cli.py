@@ -5,20 +5,19 @@ from time import sleep
 from typing import Dict, Iterator
 
 import requests
-from iso8601 import parse_date
 
 from .downloader import TwitchDownloadManager
 from .events import CheckStatus, WaitLiveVideo, WaitStream, ExceptionEvent
 from .storage import Storage
 from .twitch_api import TwitchAPI
-from .utils import retry_on_exception, Publisher
+from .utils import retry_on_exception, Publisher, parse_datetime
 
 log = logging.getLogger(__name__)
 
 
 def is_video_from_stream(video: Dict[str, str], stream: Dict[str, str]) -> bool:
     # Time between creating VOD and starting stream less than 2 minutes
-    return bool(parse_date(video['created_at']) - parse_date(stream['started_at']) < timedelta(minutes=2))
+    return bool(parse_datetime(video['created_at']) - parse_datetime(stream['started_at']) < timedelta(minutes=2))
 
 
 def delay_generator(maximum: int, step: int) -> Iterator[int]:
@@ -29,7 +28,7 @@ def new_delay() -> Iterator[int]:
     return delay_generator(900, 60)
 
 
-@retry_on_exception(requests.exceptions.RequestException)
+@retry_on_exception(requests.exceptions.RequestException, backoff=2, max_wait=300, jitter=1)
 def main(channel: str, quality: str, main_publisher: Publisher, twitch_api: TwitchAPI,
          download_manager: TwitchDownloadManager, storage: Storage) -> None:
     # noinspection PyBroadException,PyPep8
@@ -60,6 +59,10 @@ def main(channel: str, quality: str, main_publisher: Publisher, twitch_api: Twit
             sleep(waiting_time)
     except KeyboardInterrupt:
         pass
+    except requests.exceptions.RequestException:
+        # Network errors are retried by the decorator with backoff
+        log.exception('Network error')
+        raise
     except:  # noqa
         main_publisher.publish(ExceptionEvent(message='Fatal error occurred. twLiveD was down.'))
         log.exception('Fatal error')
@@ -1,55 +1,84 @@
-from typing import Dict, Any, cast
+import os
+import re
+from copy import deepcopy
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Any, Optional, cast
 
 from strictyaml import as_document, Map, Bool, Regex
 from strictyaml import load as yaml_load
 
 _WORD = Regex(r'^[\w]+$')
 _PATH = Regex(r'[^<>]+')
+_VERSION_RE = re.compile(rb'^version:\s*(\d+)\s*$', re.MULTILINE)
 
 CONFIG_FILE = 'config.yaml'
 __CONFIG_VERSION = 1
 __CONFIG_SCHEMA = Map({
-    'version': Regex(f'{__CONFIG_VERSION}'),
+    'version': Regex(f'^{__CONFIG_VERSION}$'),
     'twitch': Map({'client_id': _WORD}),
     'main': Map({'channel': _WORD, 'quality': Regex(r'^[\w]*$'), 'temp_dir': _PATH}),
     'storage': Map({'path': _PATH, 'vod_path': _PATH}),
     'telegram': Map({'enabled': Bool(), 'api_token': Regex(r'^[\w:_\-]+$'), 'chat_id': _WORD}),
 })
+_COMMENT_QUALITY = 'Depends on stream. Leave blank for source (chunked) quality.'
+_COMMENT_VOD_PATH = (
+    'Python 3.6 f-string. Valid arguments: {{title}} {{id}} {{type}} {{channel}} {{date}}\n'
+    '\'*\' will be added to the new filename if file already exist in storage')
 
 
 def load(path: str = CONFIG_FILE) -> Dict[str, Any]:
+    # Parsed config is cached until the file is modified. Copy protects cached value from callers' changes.
+    return deepcopy(_load(path, os.stat(path).st_mtime_ns))
+
+
+@lru_cache(maxsize=8)
+def _load(path: str, _mtime_ns: int) -> Dict[str, Any]:
+    # Modification time is a part of the cache key only
+    version = _peek_version(path)
+    if version is not None and version != __CONFIG_VERSION:
+        raise ConfigVersionError(f'Configuration file {path} has version {version}, expected {__CONFIG_VERSION}')
     with open(path, 'rt') as file:
         return cast(Dict[str, Any], yaml_load(file.read(), schema=__CONFIG_SCHEMA).data)
 
 
+def _peek_version(path: str) -> Optional[int]:
+    # `version` goes first in generated config. Full parsing with validation is used if it is not found.
+    with open(path, 'rb') as file:
+        match = _VERSION_RE.search(file.read(256))
+    return int(match.group(1)) if match else None
+
+
 def create(path: str = CONFIG_FILE) -> None:
-    with open(path, 'w') as file:
-        config = as_document({
-            'version': __CONFIG_VERSION,
-            'twitch': {
-                'client_id': '<your client-id>',
-            },
-            'main': {
-                'channel': '<twitch channel>',
-                'quality': '<quality>',
-                'temp_dir': '<path to temporary directory>',
-            },
-            'storage': {
-                'path': '<path where vods should be stored>',
-                'vod_path': '<"{{channel}}/{{id}} {{date:%Y-%m-%d}} {{title}}.ts">',
-            },
-            'telegram': {
-                'enabled': False,
-                'api_token': '<Telegram bot API token>',
-                'chat_id': '<your chat id>',
-            },
-        })
-
-        comment_quality = 'Depends on stream. Leave blank for source (chunked) quality.'
-        comment_vod_path = (
-            'Python 3.6 f-string. Valid arguments: {{title}} {{id}} {{type}} {{channel}} {{date}}\n'
-            '\'*\' will be added to the new filename if file already exist in storage')
-        config.as_marked_up()['main'].yaml_set_comment_before_after_key('quality', before=comment_quality, indent=2)
-        config.as_marked_up()['storage'].yaml_set_comment_before_after_key('vod_path', before=comment_vod_path,
-                                                                           indent=2)
-        file.write(config.as_yaml())
+    Path(path).write_text(_template())
+
+
+def _template() -> str:
+    config = as_document({
+        'version': __CONFIG_VERSION,
+        'twitch': {
+            'client_id': '<your client-id>',
+        },
+        'main': {
+            'channel': '<twitch channel>',
+            'quality': '<quality>',
+            'temp_dir': '<path to temporary directory>',
+        },
+        'storage': {
+            'path': '<path where vods should be stored>',
+            'vod_path': '<"{{channel}}/{{id}} {{date:%Y-%m-%d}} {{title}}.ts">',
+        },
+        'telegram': {
+            'enabled': False,
+            'api_token': '<Telegram bot API token>',
+            'chat_id': '<your chat id>',
+        },
+    })
+
+    config.as_marked_up()['main'].yaml_set_comment_before_after_key('quality', before=_COMMENT_QUALITY, indent=2)
+    config.as_marked_up()['storage'].yaml_set_comment_before_after_key('vod_path', before=_COMMENT_VOD_PATH, indent=2)
+    return cast(str, config.as_yaml())
+
+
+class ConfigVersionError(ValueError):
+    pass
@@ -1,16 +1,46 @@
 import logging.config
-from pathlib import Path
+import os
+from functools import lru_cache
+from typing import Any
 
-from ruamel.yaml import safe_load as yaml_load
+LEVEL_ENV = 'TWLIVED_LOG_LEVEL'
+_LOGGERS = ('twlived', 'urllib3')
+_configured = False
 
 
 def setup_logging(path: str = 'logging.yaml', level: int = logging.INFO) -> None:
-    if Path(path).exists():
-        with open(path, 'r') as file:
-            config_dict = yaml_load(file.read())
-        logging.config.dictConfig(config_dict)
+    # Handlers are created on the first call only. Next calls (reload, several entry points) update levels.
+    global _configured
+    try:
+        file = open(path, 'rb')
+    except FileNotFoundError:
+        if not _configured:
+            logging.basicConfig(level=level)
     else:
-        logging.basicConfig(level=level)
+        with file:
+            config_dict = _yaml().load(file)
+        if _configured:
+            config_dict['incremental'] = True
+        logging.config.dictConfig(config_dict)
+    # e.g. TWLIVED_LOG_LEVEL=DEBUG to log every request
+    if LEVEL_ENV in os.environ:
+        env_level = os.environ[LEVEL_ENV].upper()
+        # `getLevelName` returns a number only for known level names
+        if isinstance(logging.getLevelName(env_level), int):
+            for name in _LOGGERS:
+                logging.getLogger(name).setLevel(env_level)
+        else:
+            log.warning('Unknown log level %s=%s is ignored', LEVEL_ENV, os.environ[LEVEL_ENV])
+    _configured = True
+
+
+@lru_cache(maxsize=None)
+def _yaml() -> Any:
+    # Imported here: the YAML parser is not needed without a config file, while `log` is used on import.
+    from ruamel.yaml import YAML
+
+    # `pure=False` selects LibYAML based loader if it is available
+    return YAML(typ='safe', pure=False)
 
 
 log = logging.getLogger('twlived')
@@ -1,28 +1,68 @@
 import logging
 import re
-from contextlib import suppress
+from concurrent.futures import ThreadPoolExecutor
 from datetime import timedelta, datetime, timezone
 from pathlib import Path
 from tempfile import NamedTemporaryFile
 from time import monotonic, sleep
-from typing import Callable, Optional, List, cast, ClassVar, Pattern, Tuple, IO
+from typing import Callable, Optional, List, ClassVar, Pattern, Tuple, IO, Dict
 from urllib.parse import urljoin
 
 import requests
-from iso8601 import parse_date
 from m3u8 import M3U8
 from pydantic import BaseModel
+from requests.adapters import HTTPAdapter
 
 from .events import StartDownloading, PlaylistUpdate, StopDownloading, DownloadedChunk
 from .twitch_api import TwitchAPI
-from .utils import retry_on_exception, Publisher, fails_in_row, chunked
+from .utils import retry_on_exception, Publisher, chunked, parse_datetime
 
 log = logging.getLogger(__name__)
 
 
-@retry_on_exception(requests.exceptions.RequestException, wait=5, max_tries=30)
-def get_url(url: str) -> requests.Response:
-    return requests.get(url, timeout=2)
+# Keep-alive connections shared by playlist and segment requests. Pool is large enough for parallel downloading.
+_session = requests.Session()
+_session.mount('https://', HTTPAdapter(pool_maxsize=16))
+_SEGMENT_BLOCK_SIZE = 64 << 10
+# Events are read-only and this one has no fields. One instance is published for every segment.
+_DOWNLOADED_CHUNK = DownloadedChunk()
+
+
+@retry_on_exception(requests.exceptions.RequestException, wait=0.5, max_tries=20, backoff=2, max_wait=10, jitter=1)
+def get_url(url: str, headers: Optional[Dict[str, str]] = None) -> requests.Response:
+    return _session.get(url, headers=headers, timeout=2)
+
+
+def get_segment(url: str) -> bytearray:
+    content = bytearray()
+
+    # Interrupted downloading is resumed from the last received byte instead of the segment start
+    @retry_on_exception(requests.exceptions.RequestException, wait=0.5, max_tries=20, backoff=2, max_wait=10, jitter=1)
+    def load() -> None:
+        # Range offset counts bytes as sent. Compressed response would be decoded by `iter_content`.
+        headers = {'Accept-Encoding': 'identity'}
+        if content:
+            headers['Range'] = f'bytes={len(content)}-'
+        response = _session.get(url, headers=headers, stream=True, timeout=2)
+        try:
+            status = response.status_code
+            # Missing or forbidden segment is not retried. Range error restarts downloading from the first byte.
+            if status == requests.codes.requested_range_not_satisfiable:
+                del content[:]
+            elif 400 <= status < 500 and status != requests.codes.too_many_requests:
+                raise SegmentUnavailable(f'{status} {response.reason} for {url}')
+            response.raise_for_status()
+            # Range is ignored, whole segment is sent again
+            if response.status_code != requests.codes.partial_content:
+                del content[:]
+            for block in response.iter_content(_SEGMENT_BLOCK_SIZE):
+                content.extend(block)
+        finally:
+            response.close()
+
+    load()
+    # Written to file as is. Converting to `bytes` would copy the whole segment.
+    return content
 
 
 class TwitchVideo(BaseModel):  # type: ignore
@@ -46,12 +86,23 @@ class TwitchVideo(BaseModel):  # type: ignore
 
 
 class TwitchPlaylist:
+    _SEGMENT_TAG: ClassVar[str] = '#EXTINF'
+    _ENDLIST_TAG: ClassVar[str] = '#EXT-X-ENDLIST'
+    # Variant stream and its media playlist URI on the next line
+    _VARIANT_RE: ClassVar[Pattern] = re.compile(r'^#EXT-X-STREAM-INF:[^\n]*?\bVIDEO="([^"]+)"[^\n]*\n\s*(\S+)', re.M)
+
     def __init__(self, video_id: str, quality: str, variant_playlist_fetch: Callable[[], str]) -> None:
         self.video_id = video_id
         self.quality = quality
         self._m3u8: Optional[M3U8] = None
+        self._files: List[str] = []
+        self._media_sequence = 0
+        self._is_endlist = False
+        # Part of the last playlist starting from the first segment
+        self._segments_text = ''
         self._url: Optional[str] = None
-        self._variant_m3u8: Optional[M3U8] = None
+        self._base_uri: Optional[str] = None
+        self._etag: Optional[str] = None
         self._variant_fetch: Callable[[], str] = variant_playlist_fetch
 
     @property
@@ -62,58 +113,111 @@ class TwitchPlaylist:
 
     @property
     def files(self) -> List[str]:
-        return self.m3u8.files  # type: ignore
+        if not self._m3u8:
+            self.update()
+        return self._files
 
     @property
     def base_uri(self) -> str:
-        return urljoin(self.url, '.')
+        return self._base_uri or self._update_url()[1]
 
     @property
     def url(self) -> str:
-        if not self._url:
-            self._url = self._get_playlist_url()
-        return self._url
+        return self._url or self._update_url()[0]
 
     @retry_on_exception(requests.exceptions.RequestException, max_tries=2)
     def update(self, use_old_url: bool = False) -> None:
         if not use_old_url:
-            self._url = self._get_playlist_url()
-        request = get_url(self.url)
-        self._m3u8 = M3U8(request.text)
+            self._update_url()
+        # Unchanged playlist is not sent again
+        headers = {'If-None-Match': self._etag} if self._m3u8 and self._etag else None
+        try:
+            request = get_url(self.url, headers=headers)
+            request.raise_for_status()
+        except requests.exceptions.RequestException:
+            # Playlist URL could expire. Drop it so the next attempt requests a new one.
+            self._url = self._base_uri = self._etag = None
+            raise
+        if request.status_code == requests.codes.not_modified:
+            return
+        self._etag = request.headers.get('ETag')
+        # Playlists are UTF-8 (RFC 8216). `request.text` would run charset detection over the whole body.
+        self._parse(request.content.decode('utf-8'))
+
+    def _parse(self, text: str) -> None:
+        # Segments of recording VOD are only appended to the playlist. Then only new lines are parsed.
+        start = text.find(self._SEGMENT_TAG)
+        segments_text = text[start:] if start != -1 else ''
+        if (self._m3u8 and self._segments_text.endswith('\n') and
+                segments_text.startswith(self._segments_text) and self._SEGMENT_TAG in self._segments_text):
+            new_lines = segments_text[len(self._segments_text):].splitlines()
+            self._files.extend(line.strip() for line in new_lines if line.strip() and not line.startswith('#'))
+            self._is_endlist = self._is_endlist or any(line.startswith(self._ENDLIST_TAG) for line in new_lines)
+        else:
+            self._m3u8 = M3U8(text)
+            self._files = list(self._m3u8.files)
+            self._media_sequence = self._m3u8.media_sequence or 0
+            self._is_endlist = bool(self._m3u8.is_endlist)
+        self._segments_text = segments_text
+
+    def _update_url(self) -> Tuple[str, str]:
+        url = self._get_playlist_url()
+        # Segment URIs are relative to the playlist
+        base_uri = urljoin(url, '.')
+        self._url, self._base_uri, self._etag = url, base_uri, None
+        return url, base_uri
 
     def _get_playlist_url(self) -> str:
-        log.debug(f'Retrieving playlist: {self.video_id} {self.quality}')
-        self._variant_m3u8 = M3U8(self._variant_fetch())
+        log.debug('Retrieving playlist: %s %s', self.video_id, self.quality)
+        variant_playlist = self._variant_fetch()
+        quality_urls = dict(self._VARIANT_RE.findall(variant_playlist))
+        if not quality_urls:
+            variant_m3u8 = M3U8(variant_playlist)
+            quality_urls = {playlist.media[0].group_id: playlist.uri for playlist in variant_m3u8.playlists}
         try:
-            return cast(str,
-                        next(playlist.uri for playlist in self._variant_m3u8.playlists if
-                             playlist.media[0].group_id == self.quality))
-        except StopIteration:
-            qualities = [playlist.media[0].group_id for playlist in self._variant_m3u8.playlists]
-            msg = f"Got '{self.quality}' while expected one of {qualities}"
+            return quality_urls[self.quality]
+        except KeyError:
+            msg = f"Got '{self.quality}' while expected one of {list(quality_urls)}"
             log.exception(msg)
             raise
 
-    def segments_after(self, last_segment: Optional[str]) -> List[str]:
-        if last_segment is None:
-            return self.files
-        # Suppose that all segments are named like '{number}.ts' according to HLS specification
-        n = int(last_segment.rstrip('.ts'))
-        if n + 1 > len(self.files):
-            return []
-        return self.files[n + 1:]
+    @property
+    def media_sequence(self) -> int:
+        if not self._m3u8:
+            self.update()
+        return self._media_sequence
+
+    @property
+    def is_endlist(self) -> bool:
+        # No segments will be added to the playlist
+        if not self._m3u8:
+            self.update()
+        return self._is_endlist
+
+    def segments_from(self, sequence: int) -> List[str]:
+        # `sequence` is EXT-X-MEDIA-SEQUENCE number of the first required segment
+        return self.files[max(0, sequence - self.media_sequence):]
 
 
 class TwitchDownloadManager(Publisher):
     _CHUNK_SIZE = 10
     _TIME_LIMIT = _CHUNK_SIZE * 10
     _SLEEP_TIME = 30
+    _MIN_SLEEP_TIME = 2
+    _NO_SEGMENTS_TIME = 300
+    # Seconds since the first failure of a segment before it is skipped. Recording VOD segment can be missing on CDN
+    # for a while.
+    _SEGMENT_SKIP_TIME = 150
+    # Segments are 1-10 MB. Large buffer coalesces them into fewer write syscalls.
+    _WRITE_BUFFER_SIZE = 4 << 20
     _DURATION_RE: ClassVar[Pattern] = re.compile(r'(?:(?P<hours>\d+)h)?(?:(?P<minutes>\d+)m)?(?:(?P<seconds>\d+)s)?')
 
     def __init__(self, twitch_api: TwitchAPI, temporary_folder: Path) -> None:
         super().__init__()
         self._twitch_api = twitch_api
         self.temporary_folder = Path(temporary_folder)
+        # Segments of a chunk are downloaded in parallel
+        self._executor = ThreadPoolExecutor(max_workers=self._CHUNK_SIZE)
 
     def download(self, video_id: str, *,
                  quality: str = 'chunked',
@@ -125,55 +229,105 @@ class TwitchDownloadManager(Publisher):
         return self._download_archive(video_id, quality=quality)
 
     def _download_archive(self, video_id: str, quality: str) -> Tuple[TwitchVideo, Path]:
-        with NamedTemporaryFile(suffix='.ts', delete=False, dir=str(self.temporary_folder.resolve())) as file:
-            log.info(f'Create temporary file {file.name}')
+        with NamedTemporaryFile(suffix='.ts', delete=False, dir=str(self.temporary_folder.resolve()),
+                                buffering=self._WRITE_BUFFER_SIZE) as file:
+            log.info('Create temporary file %s', file.name)
             playlist = TwitchPlaylist(video_id, quality=quality,
                                       variant_playlist_fetch=lambda: self._twitch_api.get_variant_playlist(video_id))
             is_downloaded = is_recording = False
-            # next(exist_new_segment) - VODs info can be glitched sometime. Duration is increasing for hours but
-            # no new segments are added in playlist. VOD is considered complete if there is no new segments for
-            # 10*_SLEEP_TIME seconds ~ 5 minutes by default (is_downloaded = is_recording = True)
-            exist_new_segment = fails_in_row(10)
-            next(exist_new_segment)
-            last_segment: Optional[str] = None
-            log.info(f'Start downloading {video_id} with {quality} quality')
+            # VODs info can be glitched sometime. Duration is increasing for hours but no new segments are added in
+            # playlist. VOD is considered complete if there is no new segments for _NO_SEGMENTS_TIME seconds
+            # ~ 5 minutes by default (is_downloaded = is_recording = True)
+            last_new_segment_time = monotonic()
+            # Recording state is requested from API every _SLEEP_TIME seconds, playlist is refreshed more often
+            recording_check_time: Optional[float] = None
+            # Sequence number of the first segment which is not downloaded yet
+            next_segment: Optional[int] = None
+            # Time of the first failure of a segment, by its sequence number
+            segment_fails: Dict[int, float] = {}
+            log.info('Start downloading %s with %s quality', video_id, quality)
             self.publish(StartDownloading(id=video_id))
-            while not is_downloaded or (is_recording and next(exist_new_segment)):
-                is_recording = self._video_is_recording(video_id)
+            while not is_downloaded or (is_recording and
+                                        monotonic() - last_new_segment_time < self._NO_SEGMENTS_TIME):
+                if recording_check_time is None or monotonic() - recording_check_time >= self._SLEEP_TIME:
+                    is_recording = self._video_is_recording(video_id)
+                    recording_check_time = monotonic()
                 playlist.update(use_old_url=is_downloaded)
-                segments_to_load = playlist.segments_after(last_segment)
-                exist_new_segment.send(bool(segments_to_load))
+                if next_segment is None:
+                    next_segment = playlist.media_sequence
+                segments_to_load = playlist.segments_from(next_segment)
+                if segments_to_load:
+                    last_new_segment_time = monotonic()
                 self.publish(PlaylistUpdate(total_size=len(playlist.files), to_load=len(segments_to_load)))
-                is_downloaded = False
-                for chunk in chunked(segments_to_load, self._CHUNK_SIZE):
-                    start_time = monotonic()
-                    # Last downloaded or previous last_segment if no segments downloaded
-                    last_segment = self._download_chunks(playlist.base_uri, chunk, write_to=file) or last_segment
-                    # Downloading time exceeded. Assuming that time exceeded if no segments downloaded.
-                    if monotonic() - start_time > self._TIME_LIMIT:
-                        break
-                else:
-                    is_downloaded = True
-                if is_recording and is_downloaded:
-                    sleep(self._SLEEP_TIME)
-            log.info(f'Downloading {video_id} with {quality} quality successful')
+                base_uri = playlist.base_uri
+                urls = [base_uri + segment for segment in segments_to_load]
+                next_segment, is_downloaded = self._download_pass(urls, next_segment, write_to=file,
+                                                                  segment_fails=segment_fails)
+                # Catching up can take longer than _NO_SEGMENTS_TIME. The time is counted from the end of the pass.
+                if segments_to_load:
+                    last_new_segment_time = monotonic()
+                # VOD info can report recording for a while after the playlist is finalized
+                if is_downloaded and playlist.is_endlist:
+                    break
+                if not is_downloaded:
+                    # Failed segment is not requested again at once
+                    sleep(self._MIN_SLEEP_TIME)
+                elif is_recording:
+                    sleep(self._refresh_time(playlist))
+            log.info('Downloading %s with %s quality successful', video_id, quality)
             self.publish(StopDownloading())
             return TwitchVideo(**self._twitch_api.get_videos(id=[video_id])[0][0]), Path(file.name)
 
-    def _download_chunks(self, base_uri: str, segments: List[str], write_to: IO[bytes]) -> Optional[str]:
-        last_segment = None
-        with suppress(requests.exceptions.RequestException):
-            for chunk in segments:
-                write_to.write(get_url(base_uri + chunk).content)
-                self.publish(DownloadedChunk())
-                last_segment = chunk
-        return last_segment
+    def _download_pass(self, urls: List[str], next_segment: int, write_to: IO[bytes],
+                       segment_fails: Dict[int, float]) -> Tuple[int, bool]:
+        # Returns sequence number of the next segment to download and whether all `urls` are downloaded
+        for chunk in chunked(urls, self._CHUNK_SIZE):
+            start_time = monotonic()
+            downloaded = self._download_chunks(chunk, write_to=write_to)
+            next_segment += downloaded
+            # Downloading failed or time exceeded. Playlist is updated before next attempt.
+            if downloaded < len(chunk):
+                first_fail_time = segment_fails.setdefault(next_segment, monotonic())
+                if monotonic() - first_fail_time >= self._SEGMENT_SKIP_TIME:
+                    log.warning('Skip segment %s failing for %.0f seconds',
+                                next_segment, monotonic() - segment_fails.pop(next_segment))
+                    next_segment += 1
+                return next_segment, False
+            if monotonic() - start_time > self._TIME_LIMIT:
+                return next_segment, False
+        return next_segment, True
+
+    def _download_chunks(self, urls: List[str], write_to: IO[bytes]) -> int:
+        downloaded = 0
+        # Results are returned in order of segments. The first failed segment stops writing.
+        contents = self._executor.map(get_segment, urls)
+        try:
+            for content in contents:
+                write_to.write(content)
+                self.publish(_DOWNLOADED_CHUNK)
+                downloaded += 1
+        except (requests.exceptions.RequestException, SegmentUnavailable):
+            pass
+        return downloaded
+
+    def _refresh_time(self, playlist: TwitchPlaylist) -> float:
+        # New segments appear in playlist about once per EXT-X-TARGETDURATION
+        target_duration = playlist.m3u8.target_duration
+        if not target_duration:
+            return self._SLEEP_TIME
+        return max(self._MIN_SLEEP_TIME, target_duration / 2)
 
     def _video_is_recording(self, video_id: str) -> bool:
-        video = TwitchVideo(**self._twitch_api.get_videos(id=[video_id])[0][0])
-        duration_match = self._DURATION_RE.fullmatch(video.duration)
+        # Called every _SLEEP_TIME seconds while downloading. Only two fields are needed, the model is not built.
+        video = self._twitch_api.get_videos(id=[video_id])[0][0]
+        duration_match = self._DURATION_RE.fullmatch(video['duration'])
         if not duration_match or not any(duration_match.groupdict()):
-            raise ValueError(f'Duration string "{video.duration}" can not be parsed')
+            raise ValueError(f'Duration string "{video["duration"]}" can not be parsed')
         duration = timedelta(**{k: int(v) for k, v in duration_match.groupdict().items() if v})
         # Suppose that VOD finalized correctly
-        return bool((datetime.now(timezone.utc) - (parse_date(video.created_at) + duration)) < timedelta(minutes=5))
+        end_time = parse_datetime(video['created_at']) + duration
+        return bool(datetime.now(timezone.utc) - end_time < timedelta(minutes=5))
+
+
+class SegmentUnavailable(Exception):
+    pass
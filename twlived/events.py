@@ -1,50 +1,56 @@
-from pydantic import BaseModel
-
 from .utils import BaseEvent
 
 
 class MainPublisherEvent(BaseEvent):
-    pass
+    __slots__ = ()
 
 
 class CheckStatus(MainPublisherEvent):
+    __slots__ = ('channel',)
     channel: str
 
 
 class WaitLiveVideo(MainPublisherEvent):
-    pass
+    __slots__ = ()
 
 
 class WaitStream(MainPublisherEvent):
+    __slots__ = ('time',)
     time: int
 
 
 class DownloaderEvent(BaseEvent):
-    pass
+    __slots__ = ()
 
 
 class StartDownloading(DownloaderEvent):
+    __slots__ = ('id',)
     id: str
 
 
 class PlaylistUpdate(DownloaderEvent):
+    __slots__ = ('total_size', 'to_load')
     total_size: int
     to_load: int
 
 
 class DownloadedChunk(DownloaderEvent):
-    pass
+    __slots__ = ()
 
 
 class StopDownloading(DownloaderEvent):
-    pass
+    __slots__ = ()
+
 
+class DownloadingProgress:
+    # Changed for every downloaded segment
+    __slots__ = ('total_segments', 'total_downloaded_segments', 'last_chunk_size', 'downloaded_segments')
 
-class DownloadingProgress(BaseModel):  # type: ignore
-    total_segments: int = 0
-    total_downloaded_segments: int = 0
-    last_chunk_size: int = 0
-    downloaded_segments: int = 0
+    def __init__(self) -> None:
+        self.total_segments = 0
+        self.total_downloaded_segments = 0
+        self.last_chunk_size = 0
+        self.downloaded_segments = 0
 
     def chunk_loaded(self) -> None:
         self.downloaded_segments += 1
@@ -52,4 +58,5 @@ class DownloadingProgress(BaseModel):  # type: ignore
 
 
 class ExceptionEvent(BaseEvent):
+    __slots__ = ('message',)
     message: str
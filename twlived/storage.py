@@ -1,21 +1,22 @@
+import errno
 import logging
+import os
 import shelve
 import shutil
-from itertools import count
+from contextlib import suppress
+from itertools import count, chain
 from pathlib import Path
-from typing import List, ClassVar, Union, Set, Callable
-
-from iso8601 import parse_date
+from typing import List, ClassVar, Union, Set, Callable, FrozenSet, Dict
 
 from .downloader import TwitchVideo
-from .utils import sanitize_filename
+from .utils import sanitize_filename, parse_datetime
 
 log = logging.getLogger(__name__)
 
 
 class Storage:
     DB_FILENAME: ClassVar[str] = 'twlived_db'
-    _ALLOWED_BROADCAST_TYPES: ClassVar[Set[str]] = {'archive'}
+    _ALLOWED_BROADCAST_TYPES: ClassVar[FrozenSet[str]] = frozenset({'archive'})
 
     def __init__(self, storage_path: Union[Path, str],
                  channel_from_id: Callable[[str], str],
@@ -24,18 +25,24 @@ class Storage:
         self.broadcast_template = vod_path_template
         self._channel_from_id = channel_from_id
         self._vod_ids: List[str] = []
+        # IDs from database by broadcast type. Reading from `shelve` unpickles info about every broadcast
+        self._broadcast_ids: Dict[str, Set[str]] = {}
         self._create_storage_dir()
-        self._db: shelve.DbfilenameShelf = shelve.DbfilenameShelf(str(self.path.joinpath(self.DB_FILENAME).resolve()))
+        # Entries are nested dicts changed in place. Without writeback these changes are not saved.
+        self._db: shelve.DbfilenameShelf = shelve.DbfilenameShelf(str(self.path.joinpath(self.DB_FILENAME).resolve()),
+                                                                  writeback=True)
 
     def added_broadcast_ids(self, broadcast_type: str) -> Set[str]:
         if broadcast_type in self._ALLOWED_BROADCAST_TYPES:
-            if broadcast_type not in self._db:
-                self._db[broadcast_type] = {}
-            return set(self._db[broadcast_type])
+            if broadcast_type not in self._broadcast_ids:
+                if broadcast_type not in self._db:
+                    self._db[broadcast_type] = {}
+                self._broadcast_ids[broadcast_type] = set(self._db[broadcast_type])
+            return set(self._broadcast_ids[broadcast_type])
         raise DBNotAllowedBroadcastType(f'{broadcast_type} are not allowed for database file')
 
     def add_broadcast(self, broadcast: TwitchVideo, temp_file: Path, exist_ok: bool = False) -> None:
-        log.info(f'Adding broadcast {broadcast.id} related to {temp_file.resolve()}')
+        log.info('Adding broadcast %s related to %s', broadcast.id, temp_file.resolve())
         if not exist_ok and broadcast.id in self._vod_ids:
             raise BroadcastExistsError(f'{broadcast.id} already added')
         if not temp_file.exists():
@@ -45,26 +52,57 @@ class Storage:
             'id': 'v' + broadcast.id,  # naming backward compatibility with TwitchAPI v5
             'type': broadcast.type,
             'channel': self._channel_from_id(broadcast.user_id),
-            'date': parse_date(broadcast.created_at),
+            'date': parse_datetime(broadcast.created_at),
         }
-        new_path = self.path.joinpath(Path(self.broadcast_template.format(**params)))
+        new_path = self.path.joinpath(Path(self.broadcast_template.format_map(params)))
         new_path.parent.mkdir(parents=True, exist_ok=True)
-        for i in count():
-            if new_path.exists():
-                new_path = new_path.with_suffix(new_path.suffix + f'.{i:02}')
-            else:
-                break
-        log.info(f'Moving file to storage {temp_file.resolve()} to {new_path.resolve()}')
-        shutil.move(temp_file, new_path)
+        new_path = self._reserve_path(new_path)
+        log.info('Moving file to storage %s to %s', temp_file.resolve(), new_path.resolve())
+        try:
+            self._move(temp_file, new_path)
+        except OSError:
+            # Release reserved name
+            with suppress(OSError):
+                new_path.unlink()
+            raise
         new_path.chmod(0o755)
-        log.info(f'File {temp_file.resolve()} moved successful')
+        log.info('File %s moved successful', temp_file.resolve())
         self.update_db(broadcast, new_path)
 
+    @staticmethod
+    def _move(source: Path, destination: Path) -> None:
+        try:
+            os.replace(str(source), str(destination))
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+            # Temporary folder is on another filesystem. Metadata is not needed, mode is set after moving.
+            shutil.copyfile(str(source), str(destination))
+            source.unlink()
+
+    @staticmethod
+    def _reserve_path(path: Path) -> Path:
+        # One directory listing instead of checking every candidate. Duplicates are `name.00`, `name.01`, ...
+        taken = set(os.listdir(str(path.parent)))
+        names = (name for name in chain([path.name], (f'{path.name}.{i:02}' for i in count())) if name not in taken)
+        while True:
+            candidate = path.with_name(next(names))
+            # Empty file holds the name until the video replaces it. The file could appear after listing.
+            try:
+                os.close(os.open(str(candidate), os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            except FileExistsError:
+                continue
+            return candidate
+
     def _create_storage_dir(self) -> None:
         self.path.mkdir(parents=True, exist_ok=True)
         if not self.path.is_dir():
             raise NotADirectoryError('Storage path is not a directory')
 
+    def close(self) -> None:
+        # Writes back cached entries. Left to `Shelf.__del__`, it fails on interpreter shutdown.
+        self._db.close()
+
     def update_db(self, broadcast: TwitchVideo, file: Path) -> None:
         if broadcast.id in self._db[broadcast.type]:
             self._db[broadcast.type][broadcast.id]['files'].append(file.relative_to(self.path))
@@ -73,6 +111,9 @@ class Storage:
                 'info': broadcast,
                 'files': [file.relative_to(self.path)],
             }
+        if broadcast.type in self._broadcast_ids:
+            self._broadcast_ids[broadcast.type].add(broadcast.id)
+        self._db.sync()
 
 
 class BroadcastExistsError(FileExistsError):
@@ -1,10 +1,13 @@
 import functools
+import heapq
 import json
+from collections import OrderedDict
 from itertools import chain
 from time import time as utc
 from typing import Dict, List, Callable, Tuple, Any, Optional, Union
 
 import requests
+from requests.adapters import HTTPAdapter
 from mypy_extensions import DefaultNamedArg
 
 from .config_logging import log
@@ -16,14 +19,19 @@ RF = Callable[[str, DefaultNamedArg(Optional[Dict], 'params'),
 
 
 def timed_cache(func: Callable[..., Dict]) -> Callable[..., Dict]:
-    cache: Dict[str, Tuple[Dict, int]] = {}
-
+    # Tokens are cached per TwitchAPI instance. Tokens issued for one Client-ID are not shared with another.
     @functools.wraps(func)
-    def wrapper(*args: Any, **kwargs: Any) -> Dict:
-        _, video_id, *_ = args
-        if video_id not in cache or cache[video_id][1] < utc():
-            token = func(*args, **kwargs)
+    def wrapper(self: 'TwitchAPI', video_id: str, *args: Any, **kwargs: Any) -> Dict:
+        cache, expirations, now = self._token_cache, self._token_expirations, utc()
+        # Expired tokens of every video are dropped, not only of requested one
+        while expirations and expirations[0][0] < now:
+            _, expired_id = heapq.heappop(expirations)
+            if expired_id in cache and cache[expired_id][1] < now:
+                del cache[expired_id]
+        if video_id not in cache:
+            token = func(self, video_id, *args, **kwargs)
             cache[video_id] = token, json.loads(token['token'])['expires']
+            heapq.heappush(expirations, (cache[video_id][1], video_id))
         return cache[video_id][0]
 
     return wrapper
@@ -33,6 +41,13 @@ def filter_none_and_empty(dictionary: Dict) -> Dict:
     return {key: value for key, value in dictionary.items() if value}
 
 
+def check_ids_limit(**lists: Optional[List[str]]) -> None:
+    # Arguments are checked before any request is sent
+    for arg, values in lists.items():
+        if values and len(values) > TwitchAPI.MAX_IDS:
+            raise ValueError(f'You can specify up to {TwitchAPI.MAX_IDS} IDs for {arg}')
+
+
 class TwitchAPI:
     """Class implementing part of Twitch API Helix."""
 
@@ -40,17 +55,28 @@ class TwitchAPI:
     TOKEN_DOMAIN: str = 'https://api.twitch.tv/api/'
     USHER_DOMAIN: str = 'https://usher.ttvnw.net/'
     MAX_IDS: int = 100
-    STREAM_TYPES = {'all', 'live', 'vodcast'}
-    PERIODS = {'all', 'day', 'month', 'week'}
-    SORT_VALUES = {'time', 'trending', 'views'}
-    VIDEO_TYPES = {'all', 'upload', 'archive', 'highlight'}
-    headers: Dict[str, str] = {'Content-Type': 'application/json'}
+    STREAM_TYPES = frozenset({'all', 'live', 'vodcast'})
+    PERIODS = frozenset({'all', 'day', 'month', 'week'})
+    SORT_VALUES = frozenset({'time', 'trending', 'views'})
+    VIDEO_TYPES = frozenset({'all', 'upload', 'archive', 'highlight'})
+    USERS_CACHE_SIZE: int = 1024
 
     def __init__(self, client_id: str, *, request_wrapper: Optional[Callable[[RF], RF]] = None) -> None:
-        self.headers.update({'Client-ID': client_id})
-        self._request_wrapper = request_wrapper
-        self._id_storage: Dict[str, Dict] = {}
-        self._login_storage: Dict[str, Dict] = {}
+        # Keep-alive connections to API and usher domains. Headers are per instance, sent with every request.
+        self._session = requests.Session()
+        self._session.headers.update({'Content-Type': 'application/json', 'Client-ID': client_id})
+        self._session.mount('https://', HTTPAdapter(pool_connections=4))
+        # Least recently used users are dropped when the cache is full
+        self._id_storage: 'OrderedDict[str, Dict]' = OrderedDict()
+        self._login_storage: 'OrderedDict[str, Dict]' = OrderedDict()
+        # VOD access token and its expiration time by video ID
+        self._token_cache: Dict[str, Tuple[Dict, int]] = {}
+        self._token_expirations: List[Tuple[int, str]] = []
+        # Request function is wrapped once instead of on every request
+        self._get_url: RF = request_wrapper(self.__get) if request_wrapper is not None else self.__get
+
+    def close(self) -> None:
+        self._session.close()
 
     # noinspection PyShadowingBuiltins
     def get_streams(self, *,
@@ -63,16 +89,8 @@ class TwitchAPI:
                     type: str = 'all',
                     user_id: Optional[List[str]] = None,
                     user_login: Optional[List[str]] = None) -> Tuple[List[Dict], Optional[str]]:
-        limited_size_args = {
-            'community_id': len(community_id) if community_id is not None else 0,
-            'game_id': len(game_id) if game_id is not None else 0,
-            'language': len(language) if language is not None else 0,
-            'user_id': len(user_id) if user_id is not None else 0,
-            'user_login': len(user_login) if user_login is not None else 0,
-        }
-        for arg, value in limited_size_args.items():
-            if value > TwitchAPI.MAX_IDS:
-                raise ValueError(f'You can specify up to {TwitchAPI.MAX_IDS} IDs for {arg}')
+        check_ids_limit(community_id=community_id, game_id=game_id, language=language, user_id=user_id,
+                        user_login=user_login)
         if first > TwitchAPI.MAX_IDS:
             raise ValueError(f'The value of the first must be less than or equal to 100')
         if type not in TwitchAPI.STREAM_TYPES:
@@ -105,13 +123,12 @@ class TwitchAPI:
                    period: str = 'all',
                    sort: str = 'time',
                    type: str = 'all') -> Tuple[List[Dict], Optional[str]]:
-        num_args = sum(map(lambda x: int(x is not None), [id, user_id, game_id]))
+        num_args = sum(arg is not None for arg in (id, user_id, game_id))
         if num_args == 0:
             raise ValueError('Must provide one of the arguments: list of id, user_id, game_id')
         if num_args > 1:
             raise ValueError('Must provide only one of the arguments: list of id, user_id, game_id')
-        if id and len(id) > TwitchAPI.MAX_IDS:
-            raise ValueError(f'You can specify up to {TwitchAPI.MAX_IDS} IDs')
+        check_ids_limit(id=id)
         if after and before:
             raise ValueError('Provide only one pagination direction.')
         if first > TwitchAPI.MAX_IDS:
@@ -144,16 +161,19 @@ class TwitchAPI:
                   retrieve_new: bool = False) -> List[Dict[str, Union[str, int]]]:
         if not (id or login):
             raise ValueError('Specify one argument list of IDs or list of logins')
-        if id and len(id) > TwitchAPI.MAX_IDS:
-            raise ValueError(f'You can specify up to {TwitchAPI.MAX_IDS} IDs')
-        if login and len(login) > TwitchAPI.MAX_IDS:
-            raise ValueError(f'You can specify up to {TwitchAPI.MAX_IDS} logins')
-        id, login = id or [], login or []
+        check_ids_limit(id=id, login=login)
+        # One cached user (e.g. channel name by ID) is returned without building request lists
+        if not retrieve_new and bool(id) != bool(login) and len(id or login or []) == 1:
+            user = self._cached_user(self._id_storage if id else self._login_storage, (id or login or [])[0])
+            if user is not None:
+                return [user]
+        # Drop duplicates (keeping order) so that each user is requested once
+        id, login = list(dict.fromkeys(id or [])), list(dict.fromkeys(login or []))
         if retrieve_new:
             missing_ids, missing_logins = id, login
         else:
-            missing_ids = list(filter(lambda x: x not in self._id_storage, id or []))
-            missing_logins = list(filter(lambda x: x not in self._login_storage, login or []))
+            missing_ids = [id_ for id_ in id if id_ not in self._id_storage]
+            missing_logins = [login_ for login_ in login if login_ not in self._login_storage]
         params: Dict[str, Union[str, List[str]]] = filter_none_and_empty({
             'id': missing_ids,
             'login': missing_logins,
@@ -161,18 +181,31 @@ class TwitchAPI:
         if params:
             response = self._helix_get('users', params=params).json()
             for user in response['data']:
-                self._id_storage[user['id']] = user
-                self._login_storage[user['login']] = user
+                self._cache_user(self._id_storage, user['id'], user)
+                self._cache_user(self._login_storage, user['login'], user)
+
+        return [user for user in chain((self._cached_user(self._id_storage, id_) for id_ in id),
+                                       (self._cached_user(self._login_storage, login_) for login_ in login))
+                if user is not None]
+
+    @staticmethod
+    def _cached_user(storage: 'OrderedDict[str, Dict]', key: str) -> Optional[Dict]:
+        user = storage.get(key)
+        if user is not None:
+            storage.move_to_end(key)
+        return user
 
-        return list(user for user in chain((self._id_storage.get(id_, None) for id_ in set(id)),
-                                           (self._login_storage.get(login_, None) for login_ in set(login)))
-                    if user is not None)
+    @staticmethod
+    def _cache_user(storage: 'OrderedDict[str, Dict]', key: str, user: Dict) -> None:
+        storage[key] = user
+        storage.move_to_end(key)
+        if len(storage) > TwitchAPI.USERS_CACHE_SIZE:
+            storage.popitem(last=False)
 
     @timed_cache
     def get_video_token(self, video_id: str) -> Dict:
         response: Dict = self._get(f'{TwitchAPI.TOKEN_DOMAIN}vods/{video_id}/access_token',
-                                   params={'need_https': 'true'},
-                                   headers=self.headers).json()
+                                   params={'need_https': 'true'}).json()
         return response
 
     def get_variant_playlist(self, video_id: str) -> str:
@@ -185,11 +218,10 @@ class TwitchAPI:
                              'allow_audio_only': 'true',
                          }).text
 
-    @staticmethod
-    def __get(url: str, *,
+    def __get(self, url: str, *,
               params: Optional[Dict] = None,
               headers: Optional[Dict[str, str]] = None) -> requests.Response:
-        response = requests.get(url, params=params, headers=headers)
+        response = self._session.get(url, params=params, headers=headers)
         response.raise_for_status()
         # TODO: support Rate Limits https://dev.twitch.tv/docs/api#rate-limits
         return response
@@ -197,12 +229,7 @@ class TwitchAPI:
     def _get(self, url: str, *,
              params: Optional[Dict] = None,
              headers: Optional[Dict[str, str]] = None) -> requests.Response:
-        if self._request_wrapper is not None:
-            get_url = self._request_wrapper(self.__get)
-        else:
-            get_url = self.__get
-        response = get_url(url, params=params, headers=headers)
-        return response
+        return self._get_url(url, params=params, headers=headers)
 
     def _helix_get(self, path: str, *, params: Optional[Dict[str, Union[str, List[str]]]] = None) -> requests.Response:
-        return self._get(TwitchAPI.OFFICIAL_API + path, params=params, headers=self.headers)
+        return self._get(TwitchAPI.OFFICIAL_API + path, params=params)
@@ -1,5 +1,5 @@
 from .pubsub import BaseEvent, Provider, Publisher, Subscriber
-from .utils import retry_on_exception, chunked, sanitize_filename, fails_in_row
+from .utils import retry_on_exception, chunked, sanitize_filename, parse_datetime
 
 __all__ = ['BaseEvent', 'Provider', 'Publisher', 'Subscriber', 'retry_on_exception', 'chunked', 'sanitize_filename',
-           'fails_in_row']
+           'parse_datetime']
@@ -1,13 +1,32 @@
 from abc import ABC, abstractmethod
 from itertools import chain
-from typing import Type, Optional, Dict, List
+from typing import Type, Optional, Dict, List, Any, ClassVar, Tuple
 
-from pydantic import BaseModel
 
+class BaseEvent:
+    # Fields are declared by annotations in subclasses. Events are published for every downloaded segment,
+    # so they are plain objects with read-only attributes instead of validated models.
+    # Subclasses declare `__slots__` with their fields, so events have no instance `__dict__`
+    __slots__ = ()
+    _fields: ClassVar[Tuple[str, ...]] = ()
 
-# TODO: rewrite w/o pydantic and with read-only attributes
-class BaseEvent(BaseModel):  # type: ignore
-    pass
+    def __init_subclass__(cls, **kwargs: Any) -> None:
+        super().__init_subclass__(**kwargs)  # type: ignore
+        annotations = cls.__dict__.get('__annotations__', {})
+        cls._fields = cls._fields + tuple(name for name in annotations if name not in cls._fields)
+
+    def __init__(self, **kwargs: Any) -> None:
+        if kwargs.keys() != set(self._fields):
+            raise TypeError(f'{self.__class__.__name__} expects fields {list(self._fields)}, got {list(kwargs)}')
+        for name, value in kwargs.items():
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        raise AttributeError(f'{self.__class__.__name__} is read-only')
+
+    def __repr__(self) -> str:
+        fields = ', '.join(f'{name}={getattr(self, name)!r}' for name in self._fields)
+        return f'{self.__class__.__name__}({fields})'
 
 
 class Provider:
@@ -1,9 +1,10 @@
 import functools
-import operator
-from collections import deque
-from itertools import repeat
+import random
+from datetime import datetime
 from time import sleep
-from typing import List, Tuple, Callable, Any, Generator, TypeVar, Iterator, Union, Type, Optional
+from typing import List, Tuple, Callable, Any, TypeVar, Iterator, Union, Type, Optional, cast
+
+from iso8601 import parse_date
 
 FT = Callable[..., Any]
 T = TypeVar('T')
@@ -11,11 +12,16 @@ T = TypeVar('T')
 
 def retry_on_exception(exceptions: Union[Type[Exception], Tuple[Type[Exception]]],
                        wait: float = 2,
-                       max_tries: int = Optional[None]) -> Callable[[FT], FT]:
+                       max_tries: Optional[int] = None,
+                       backoff: float = 1,
+                       max_wait: Optional[float] = None,
+                       jitter: float = 0) -> Callable[[FT], FT]:
+    # Delay before n-th retry is `wait * backoff ** (n - 1)` limited by `max_wait` plus random [0, jitter] seconds
     def decorator(f: FT) -> FT:
         @functools.wraps(f)
         def wrapper(*args: Any, **kwargs: Any) -> Any:
             tries = 0
+            delay = wait
             while True:
                 tries += 1
                 try:
@@ -24,7 +30,10 @@ def retry_on_exception(exceptions: Union[Type[Exception], Tuple[Type[Exception]]
                 except exceptions:
                     if tries == max_tries:
                         raise
-                    sleep(wait)
+                    sleep(delay + random.uniform(0, jitter))
+                    delay *= backoff
+                    if max_wait is not None:
+                        delay = min(delay, max_wait)
                 else:
                     return result
 
@@ -45,9 +54,7 @@ def sanitize_filename(filename: str, replace_to: str = '') -> str:
     return filename
 
 
-def fails_in_row(num: int) -> Generator[bool, bool, None]:
-    buffer = deque(repeat(True, num), maxlen=num)
-    while True:
-        new_value = yield functools.reduce(operator.ior, buffer)
-        if new_value is not None:
-            buffer.append(new_value)
+@functools.lru_cache(maxsize=128)
+def parse_datetime(value: str) -> datetime:
+    # Video and stream timestamps are checked on every poll. Each distinct string is parsed once.
+    return cast(datetime, parse_date(value))
@@ -1,3 +1,5 @@
+from time import monotonic
+
 import requests
 
 from .events import CheckStatus, WaitLiveVideo, WaitStream, StartDownloading, DownloadedChunk, StopDownloading, \
@@ -6,9 +8,13 @@ from .utils import BaseEvent, Subscriber, retry_on_exception
 
 
 class ConsoleView(Subscriber):
+    # Seconds between progress lines. Segments are downloaded in parallel, so there are several per second.
+    _PROGRESS_INTERVAL = 1
+
     def __init__(self) -> None:
         super().__init__()
         self._progress = DownloadingProgress()
+        self._progress_time = 0.0
 
     def handle(self, event: BaseEvent) -> None:
         if isinstance(event, CheckStatus):
@@ -23,6 +29,12 @@ class ConsoleView(Subscriber):
             self._progress.downloaded_segments = 0
         elif isinstance(event, DownloadedChunk):
             self._progress.chunk_loaded()
+            now = monotonic()
+            # The last segment of an update is always shown
+            if (now - self._progress_time < self._PROGRESS_INTERVAL and
+                    self._progress.downloaded_segments < self._progress.last_chunk_size):
+                return
+            self._progress_time = now
             print(f'\rLast: {self._progress.downloaded_segments:>5}/{self._progress.last_chunk_size:>5}  '
                   f'Total: {self._progress.total_downloaded_segments:>5}/{self._progress.total_segments:>5}', end='')
         elif isinstance(event, StopDownloading):
@@ -36,6 +48,8 @@ class TelegramView(Subscriber):
         super().__init__()
         self.token = token
         self.chat_id = chat_id
+        # Keep-alive connection to Telegram API between messages
+        self._session = requests.Session()
 
     def handle(self, event: BaseEvent) -> None:
         if isinstance(event, StartDownloading):
@@ -45,6 +59,6 @@ class TelegramView(Subscriber):
 
     @retry_on_exception(requests.exceptions.RequestException, max_tries=50)
     def send_message(self, message: str) -> None:
-        request = requests.post(f'https://api.telegram.org/bot{self.token}/sendMessage',
-                                params={'chat_id': self.chat_id, 'text': message}, timeout=2)
+        request = self._session.post(f'https://api.telegram.org/bot{self.token}/sendMessage',
+                                     params={'chat_id': self.chat_id, 'text': message}, timeout=2)
         request.raise_for_status()